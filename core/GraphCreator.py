@@ -1,11 +1,17 @@
+import copy
+import hashlib
+import os
+
 import numpy as np
 import json
 import networkx as nx
 
+from core.SearchIndex import SearchIndex
+
 
 class GraphCreator:
 
-    def __init__(self, itemPath : str, recipePath : str):
+    def __init__(self, itemPath : str, recipePath : str, indexPath=None):
         """
         Generates the basic structure of the recipe graph, a Directed Acyclic Graph.
         There are 4 node types :
@@ -17,9 +23,11 @@ class GraphCreator:
 
         :param itemPath: path to the item list txt
         :param recipePath: path to the recipe json file
+        :param indexPath: path to the search index json file, it is reused if it was built from the same files and written otherwise
         """
         self.itemPath = itemPath
         self.recipePath = recipePath
+        self.indexPath = indexPath
 
         # Item list
         self.itemList, self.modList = self._getItems()
@@ -33,6 +41,43 @@ class GraphCreator:
         self.G = self.originalGraph.copy()
         self._collapseCycles()
 
+        # Masks, the split cycles are kept in self._maskGraph and shared by every masked graph
+        self.recipesByType, self.recipesByMod = self._getRecipeLookups()
+        self._nodeType = dict(self.originalGraph.nodes(data="type"))
+        self._pred = {n: list(p) for n, p in self.originalGraph.pred.items()}
+        self._succ = {n: list(s) for n, s in self.originalGraph.succ.items()}
+        # What the graph takes as given : the nodes made from nothing, and the members of the cycles with no way in
+        self._sources = [n for n, p in self._pred.items() if not p]
+        self._sources += [n for cycleid, cycle in self.cycles.items() if self.G.in_degree(cycleid) == 0 for n in cycle]
+        self._maskGraph = None
+        self._splitCycleIds = {}
+        self._cycleSplits = {}
+
+        # Search index, it follows the graph (and its copies / subgraphs) through the graph attributes
+        self.searchIndex = self._getSearchIndex()
+        self.originalGraph.graph["searchIndex"] = self.searchIndex
+        self.G.graph["searchIndex"] = self.searchIndex
+
+    def _getFingerprint(self) -> str:
+        fingerprint = hashlib.sha256()
+        for path in [self.itemPath, self.recipePath]:
+            with open(path, "rb") as f:
+                fingerprint.update(f.read())
+        return fingerprint.hexdigest()
+
+    def _getSearchIndex(self) -> SearchIndex:
+        fingerprint = self._getFingerprint()
+        if self.indexPath is not None and os.path.exists(self.indexPath):
+            index = SearchIndex.load(self.indexPath)
+            # The saved index is only reused if it was built from the same items and recipes
+            if index.fingerprint == fingerprint:
+                return index
+
+        index = SearchIndex.fromGraph(self.originalGraph, fingerprint)
+        if self.indexPath is not None:
+            index.save(self.indexPath)
+        return index
+
     def _getItems(self) -> tuple[list, list]:
         items = open(self.itemPath).readlines()
         items = [s.replace("\n", "") for s in items]
@@ -71,6 +116,8 @@ class GraphCreator:
                 type="recipe",
                 SCT=set(),
                 hasComputed=False,
+                recipeType=self.recipeDict[r]['type'],
+                mod=r.split(":")[0],
                 color='green',
                 size=15,
                 shape="diamond")
@@ -120,7 +167,8 @@ class GraphCreator:
         toRemove = set()
         cycleIn = set()
         cycleOut = set()
-        for cycleid,cycle in self._getCycles().items():
+        self.cycles = self._getCycles()
+        for cycleid,cycle in self.cycles.items():
             # We set the corresponding cycle subgraph as a node attribute
             self.G.add_node(
                 cycleid,
@@ -157,6 +205,140 @@ class GraphCreator:
         self.G.add_edges_from(cycleOut)
         self.G.remove_nodes_from(toRemove)
 
+    def _getRecipeLookups(self) -> tuple[dict[str, set], dict[str, set]]:
+        recipesByType = {}
+        recipesByMod = {}
+        for n, data in self.originalGraph.nodes(data=True):
+            if data["type"] == "recipe":
+                recipesByType.setdefault(data["recipeType"], set()).add(n)
+                recipesByMod.setdefault(data["mod"], set()).add(n)
+        return recipesByType, recipesByMod
+
+    def _getSplitCycle(self, cycleid : str, cycle : frozenset) -> str:
+        """
+        Adds the cycle node made of what is left of a cycle to the mask graph, once for every distinct split.
+
+        :param cycleid: the cycle this SCC comes from
+        :param cycle: the nodes of the SCC
+        :return: the name of the cycle node
+        """
+        splits = self._splitCycleIds.setdefault(cycleid, {})
+        if cycle not in splits:
+            splits[cycle] = f"{cycleid}-{len(splits)}"
+            pred = self.originalGraph.pred
+            succ = self.originalGraph.succ
+            # The in / out edges are filtered for each scenario, like those of the untouched cycles
+            self._maskGraph.add_node(
+                splits[cycle],
+                type="cycle",
+                SCT=None,
+                hasComputed=False,
+                subgraph=self.originalGraph.subgraph(cycle).copy(),
+                inEdges=[(p, n, d) for n in cycle for p, d in pred[n].items() if p not in cycle],
+                outEdges=[(s, n, d) for n in cycle for s, d in succ[n].items() if s not in cycle],
+                shape="triangleDown", color="black", size=50)
+        return splits[cycle]
+
+    def _splitCycles(self, masked : set[str]) -> dict[str, str]:
+        """
+        Splits the cycles containing a masked recipe into the SCCs that remain once it is removed.
+        Cycles not touched by the mask are kept as they are.
+
+        :param masked: the set of masked recipe nodes
+        :return: The node to cycle mapping once the masked recipes are removed
+        """
+        if self._maskGraph is None:
+            # Holds self.G and the split cycles of every scenario, it is never modified otherwise
+            self._maskGraph = self.G.copy()
+
+        affected = {self.nodeToCycle[n] for n in masked if n in self.nodeToCycle}
+        nodeToCycle = {n: c for n, c in self.nodeToCycle.items() if c not in affected}
+
+        # Removing nodes can only split a SCC, so only the affected cycles need recomputing
+        for cycleid in affected:
+            remaining = frozenset(self.cycles[cycleid] - masked)
+            if (cycleid, remaining) not in self._cycleSplits:
+                sccs = [c for c in nx.strongly_connected_components(self.originalGraph.subgraph(remaining)) if len(c) > 1]
+                self._cycleSplits[cycleid, remaining] = [(self._getSplitCycle(cycleid, frozenset(c)), c) for c in sccs]
+            for splitid, c in self._cycleSplits[cycleid, remaining]:
+                for n in c:
+                    nodeToCycle[n] = splitid
+
+        return nodeToCycle
+
+    def _recollapseCycles(self, removed : set[str], nodeToCycle : dict[str, str]) -> tuple[dict[str, str], set[str]]:
+        """
+        Brings the split cycles and the nodes no longer part of any cycle into the mask graph.
+
+        The nodes and edges this needs are added to the mask graph, which holds them for every scenario.
+        Each node is only visible under one form in a scenario (itself, its cycle or what is left of it),
+        so the edges between the visible nodes are always the right ones.
+
+        :param removed: the set of removed nodes, masked recipes and the nodes they leave unreachable
+        :param nodeToCycle: the node to cycle mapping once the masked recipes are removed, see _splitCycles
+        :return: the node to cycle mapping of the masked graph, and the nodes to show on top of the untouched ones
+        """
+        # Unreachable nodes are removed along with the whole cycle they belong to, see getUnreachable
+        nodeToCycle = {n: c for n, c in nodeToCycle.items() if n not in removed}
+        affected = {self.nodeToCycle[n] for n in removed if n in self.nodeToCycle}
+        freed = {n for cycleid in affected for n in self.cycles[cycleid] if n not in removed}
+
+        def rep(n):
+            return nodeToCycle.get(n, n)
+
+        # Split cycles, and nodes which are no longer part of any cycle
+        overlay = {rep(n) for n in freed}
+        for n in freed - nodeToCycle.keys():
+            if n not in self._maskGraph:
+                self._maskGraph.add_node(n, **self.originalGraph.nodes[n])
+
+        # Reconnects the freed nodes and split cycles, edges touching a cycle hold no weight
+        pred = self.originalGraph.pred
+        succ = self.originalGraph.succ
+        edges = [(p, n, d) for n in freed for p, d in pred[n].items() if p not in removed]
+        edges += [(n, s, d) for n in freed for s, d in succ[n].items() if s not in removed]
+        for u, v, data in edges:
+            if rep(u) == rep(v) or self._maskGraph.has_edge(rep(u), rep(v)):
+                continue
+            if u in nodeToCycle or v in nodeToCycle:
+                self._maskGraph.add_edge(rep(u), rep(v))
+            else:
+                self._maskGraph.add_edge(u, v, **data)
+
+        return nodeToCycle, overlay
+
+    @staticmethod
+    def _getStateView(graph : nx.DiGraph, nodes : set[str]) -> nx.DiGraph:
+        """
+        Read-only view of the graph restricted to the given nodes, which shares its structure
+        but holds its own copy of the node attributes, where the solvers write their state.
+        The SCT and originalSCT values the solvers write are copied as well, so that updating one in place does not leak either.
+
+        Networkx reads the node attributes of a graph, views included, through its _node dict,
+        which subgraph_view sets to a filtered window on the attributes of the viewed graph.
+        Swapping it for a dict of copies over the same nodes keeps the view consistent without copying the structure.
+        Should networkx stop reading node attributes from _node, a plain graph is built instead.
+
+        :param graph: the viewed graph
+        :param nodes: the nodes to show
+        :return: the view
+        """
+        view = nx.subgraph_view(graph, filter_node=nx.filters.show_nodes(nodes))
+        state = {n: dict(data) for n, data in graph.nodes(data=True) if n in nodes}
+        for data in state.values():
+            data["SCT"] = copy.copy(data["SCT"])
+            if "originalSCT" in data:
+                data["originalSCT"] = copy.copy(data["originalSCT"])
+        view._node = state
+        n = next(iter(state), None)
+        if n is None or view.nodes[n] is state[n]:
+            return view
+
+        plain = nx.DiGraph()
+        plain.graph = graph.graph
+        plain.add_nodes_from(state.items())
+        plain.add_edges_from(nx.subgraph_view(graph, filter_node=nx.filters.show_nodes(nodes)).edges(data=True))
+        return plain
 
     # --------------------------------------------------------------------
     #                            Public Methods
@@ -196,3 +378,127 @@ class GraphCreator:
                 deadend.append(n)
 
         return set(deadend)
+
+    def getMaskedRecipes(self, disabledTypes=None, enabledTypes=None, disabledMods=None, enabledMods=None) -> set[str]:
+        """
+        Selects the recipe nodes hidden by a recipe-type / mod mask.
+        A recipe is masked if its type or mod is disabled, or if it is not part of the enabled ones when given.
+
+        :param disabledTypes: recipe types to mask, e.g. ["stonecutting"]
+        :param enabledTypes: if given, only these recipe types are kept, e.g. ["crafting"]
+        :param disabledMods: mods whose recipes are masked
+        :param enabledMods: if given, only the recipes of these mods are kept, e.g. ["minecraft"]
+
+        :return: The set of masked recipe nodes
+        """
+        masked = set()
+
+        for recipeType, recipes in self.recipesByType.items():
+            if ((disabledTypes is not None and recipeType in disabledTypes)
+                    or (enabledTypes is not None and recipeType not in enabledTypes)):
+                masked.update(recipes)
+
+        for mod, recipes in self.recipesByMod.items():
+            if ((disabledMods is not None and mod in disabledMods)
+                    or (enabledMods is not None and mod not in enabledMods)):
+                masked.update(recipes)
+
+        return masked
+
+    def getUnreachable(self, masked : set[str], nodeToCycle=None) -> set[str]:
+        """
+        Nodes which can no longer be made once the masked recipes are removed.
+        What can still be made is walked forward from what the graph takes as given (the nodes without
+        any predecessor, such as raw items, and the members of the cycles with no way in, the atoms of self.G) :
+            - a recipe needs all of its ingredients
+            - an ingredient needs any one of its items
+            - an item needs any one of its recipes
+            - a cycle left by the mask is made as a whole, as soon as anything flows into it, as in self.G
+        Everything not reached is unreachable, and so are the ingredients only used by removed recipes.
+        Without a mask, every node is reached.
+
+        :param masked: the set of masked recipe nodes
+        :param nodeToCycle: the node to cycle mapping once the masked recipes are removed, computed when not given
+        :return: The set of unreachable nodes, masked recipes excluded
+        """
+        if nodeToCycle is None:
+            nodeToCycle = self._splitCycles(masked)
+        members = {}
+        for n, cycleid in nodeToCycle.items():
+            members.setdefault(cycleid, []).append(n)
+
+        pred = self._pred
+        succ = self._succ
+        missing = {}
+        reached = set()
+        queue = []
+
+        def reach(n):
+            for m in members[nodeToCycle[n]] if n in nodeToCycle else [n]:
+                reached.add(m)
+                queue.append(m)
+
+        for n in self._sources:
+            if n not in reached and n not in masked:
+                reach(n)
+
+        while queue:
+            n = queue.pop()
+            for m in succ[n]:
+                if m in reached or m in masked:
+                    continue
+                if m not in nodeToCycle and self._nodeType[m] == "recipe":
+                    missing[m] = missing.get(m, len(pred[m])) - 1
+                    if missing[m] > 0:
+                        continue
+                reach(m)
+
+        unreachable = self._nodeType.keys() - reached - masked
+        removed = masked | unreachable
+        for r in removed:
+            if self._nodeType[r] == "recipe":
+                for i in pred[r]:
+                    if i not in removed and removed.issuperset(succ[i]):
+                        unreachable.add(i)
+
+        return unreachable
+
+    def getMaskedGraph(self, disabledTypes=None, enabledTypes=None, disabledMods=None, enabledMods=None) -> nx.DiGraph:
+        """
+        Applies a recipe-type / mod mask to the already built graph, without rebuilding it.
+        The masked recipes are removed along with the nodes they leave unreachable (see getUnreachable),
+        so that an item or a cycle only made through a masked recipe does not turn into an atomic input.
+        Only the cycles containing a removed node are recomputed, the other ones are reused as is.
+        The result is a collapsed DAG, like self.G, on which the propagation can be run.
+
+        The structure is a read-only view over a graph shared by every scenario,
+        but the node attributes and cycle subgraphs are copied,
+        so the solver state of a scenario does not leak into self.G or other scenarios.
+        The masked recipes, the unreachable nodes and the node to cycle mapping are stored in the
+        "masked", "unreachable" and "nodeToCycle" graph attributes.
+
+        :param disabledTypes: recipe types to mask, e.g. ["stonecutting"]
+        :param enabledTypes: if given, only these recipe types are kept, e.g. ["crafting"]
+        :param disabledMods: mods whose recipes are masked
+        :param enabledMods: if given, only the recipes of these mods are kept, e.g. ["minecraft"]
+
+        :return: The masked graph
+        """
+        masked = self.getMaskedRecipes(disabledTypes, enabledTypes, disabledMods, enabledMods)
+        nodeToCycle = self._splitCycles(masked)
+        unreachable = self.getUnreachable(masked, nodeToCycle)
+        removed = masked | unreachable
+        affected = {self.nodeToCycle[n] for n in removed if n in self.nodeToCycle}
+
+        nodeToCycle, overlay = self._recollapseCycles(removed, nodeToCycle)
+        visible = (set(self.G) - removed - affected) | overlay
+
+        graph = self._getStateView(self._maskGraph, visible)
+        graph.graph = {**self._maskGraph.graph, "masked": masked, "unreachable": unreachable, "nodeToCycle": nodeToCycle}
+        for cycleid in set(nodeToCycle.values()):
+            data = graph.nodes[cycleid]
+            data["subgraph"] = self._getStateView(data["subgraph"], set(data["subgraph"]))
+            data["inEdges"] = [e for e in data["inEdges"] if e[0] not in removed]
+            data["outEdges"] = [e for e in data["outEdges"] if e[0] not in removed]
+
+        return graph
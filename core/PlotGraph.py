@@ -1,8 +1,14 @@
+import json
+import webbrowser
+
 from pyvis.network import Network
 import numpy as np
 
+from core.SearchIndex import SearchIndex
+
 def plotGraph(G, name, ylim=1000, fixedInOut=True):
-    g = Network(width=1900, height=1000, directed=True, select_menu=True)
+    # The search bar below replaces pyvis' select menu, which lists every node in the HTML
+    g = Network(width=1900, height=1000, directed=True)
     g.options.edges.smooth.enabled = False
     g.from_nx(cleanupGraph(G))
 
@@ -80,7 +86,191 @@ def plotGraph(G, name, ylim=1000, fixedInOut=True):
     """)
 
 
-    g.show(f"../{name}.html", notebook=False)
+    # Same as g.show, with the search bar added before opening the page
+    g.write_html(f"../{name}.html")
+    with open(f"../{name}.html") as f:
+        html = f.read()
+    with open(f"../{name}.html", "w") as f:
+        f.write(html.replace("</body>", searchBar(G) + "</body>"))
+    webbrowser.open(f"../{name}.html")
+
+def searchBar(G):
+    """
+    Search bar for the exported HTML, backed by the search index of the graph restricted to the plotted nodes.
+    The nodes within a collapsed cycle stay searchable, selecting them selects their cycle node.
+    The lookup logic mirrors SearchIndex.search, and clicking an item also lists the recipes producing / consuming it.
+
+    :param G: the plotted graph
+    :return: the HTML to insert in the page
+    """
+    index = G.graph.get("searchIndex") or SearchIndex.fromGraph(G)
+
+    cycles = {n: set(data["subgraph"]) for n, data in G.nodes(data=True) if data["type"] == "cycle"}
+
+    data = index.toDict(set(G.nodes).union(*cycles.values()))
+    table = {n: i for i, n in enumerate(SearchIndex.getNodes(data))}
+    # The cycle members, by position in the node table
+    data["plotted"] = {c: [table[m] for m in members if m in table] for c, members in cycles.items()}
+    return SEARCH_BAR.replace("SEARCH_INDEX", json.dumps(data, separators=(",", ":")))
+
+SEARCH_BAR = """
+<div style="position: absolute; top: 10px; left: 10px; width: 400px; z-index: 10; background: white; font-family: sans-serif; font-size: 12px;">
+    <div style="display: flex;">
+        <input id="search-input" placeholder="Search : prefix, mod: or any part of an id" style="flex: 1;">
+        <button type="button" onclick="resetSelection();">Reset Selection</button>
+    </div>
+    <div id="search-results" style="max-height: 400px; overflow-y: auto;"></div>
+</div>
+<script type="text/javascript">
+    // Highlighting on selection, as with pyvis' select menu
+    var highlightActive = false;
+    network.on("selectNode", neighbourhoodHighlight);
+
+    const searchIndex = SEARCH_INDEX;
+
+    // Node table as in SearchIndex.getNodes : the items, then the recipes of each type, named "{type}-{id}"
+    const recipeIds = Object.values(searchIndex.recipes).flat();
+    const searchNodes = searchIndex.items.concat(...Object.entries(searchIndex.recipes).map(([t, ids]) => ids.map(r => t + "-" + r)));
+    const plotted = {};
+    Object.entries(searchIndex.plotted).forEach(([cycle, members]) => members.forEach(m => plotted[searchNodes[m]] = cycle));
+
+    // Items first, as for equal keys
+    const namespaces = {};
+    searchIndex.items.concat(recipeIds).forEach((key, n) => (namespaces[key.split(":")[0]] = namespaces[key.split(":")[0]] || []).push(n));
+
+    // (key, node) pairs, a recipe is also found by its id
+    const keys = searchNodes.map((node, n) => [node, n]).concat(recipeIds.map((r, i) => [r, searchIndex.items.length + i]));
+    const compare = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+    keys.sort((a, b) => compare(a[0].toLowerCase(), b[0].toLowerCase())
+        || (a[0] !== searchNodes[a[1]]) - (b[0] !== searchNodes[b[1]]) || compare(searchNodes[a[1]], searchNodes[b[1]]));
+    const searchKeys = keys.map(k => k[0].toLowerCase());
+
+    // A stable sort by length ranks the keys by closeness as in SearchIndex
+    const rankedKeys = [...keys].sort((a, b) => a[0].length - b[0].length);
+    const rankedLower = rankedKeys.map(k => k[0].toLowerCase());
+    const rankedGrams = rankedLower.map(trigrams);
+    const searchPostings = {};
+    rankedGrams.forEach((grams, r) => grams.forEach(g => (searchPostings[g] = searchPostings[g] || []).push(r)));
+    const shortPostings = {};
+    rankedLower.forEach((key, r) => {
+        const parts = new Set();
+        for (let n = 1; n <= 2; n++) for (let i = 0; i + n <= key.length; i++) parts.add(key.slice(i, i + n));
+        parts.forEach(part => (shortPostings[part] = shortPostings[part] || []).push(r));
+    });
+
+    function trigrams(key) {
+        key = key.toLowerCase();
+        if (key.length < 3) return new Set([key]);
+        const grams = new Set();
+        for (let i = 0; i < key.length - 2; i++) grams.add(key.slice(i, i + 3));
+        return grams;
+    }
+
+    function searchPrefix(prefix, limit) {
+        let lo = 0, hi = searchKeys.length;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (searchKeys[mid] < prefix) lo = mid + 1; else hi = mid;
+        }
+        const results = new Set();
+        for (let i = lo; i < searchKeys.length && searchKeys[i].startsWith(prefix) && results.size < limit; i++) results.add(keys[i][1]);
+        return [...results];
+    }
+
+    function searchSubstring(query, limit) {
+        let candidates;
+        if (query.length < 3) {
+            candidates = shortPostings[query] || [];
+        } else {
+            candidates = [...trigrams(query)].map(g => searchPostings[g] || []).reduce((a, b) => (a.length <= b.length ? a : b));
+        }
+        const results = new Set();
+        for (const r of candidates) {
+            if (results.size >= limit) break;
+            if (rankedLower[r].includes(query)) results.add(rankedKeys[r][1]);
+        }
+        return [...results];
+    }
+
+    function searchFuzzy(query, limit, threshold = 0.5) {
+        const grams = trigrams(query.replaceAll(" ", "_"));
+        const needed = Math.max(1, Math.ceil(threshold * grams.size));
+        const scores = new Map();
+        const best = new Map();
+        const sorted = [...grams].sort((a, b) => (searchPostings[a] || []).length - (searchPostings[b] || []).length);
+        for (let i = 0; i < sorted.length; i++) {
+            // Keys holding none of the trigrams read so far cannot beat the current results
+            const remaining = sorted.length - i;
+            if (remaining < needed) break;
+            if (best.size >= limit && remaining < [...best.values()].sort((a, b) => b - a)[limit - 1]) break;
+            for (const r of searchPostings[sorted[i]] || []) {
+                if (scores.has(r)) continue;
+                let shared = 0;
+                grams.forEach(g => shared += rankedGrams[r].has(g));
+                scores.set(r, shared);
+                best.set(rankedKeys[r][1], Math.max(best.get(rankedKeys[r][1]) || 0, shared));
+            }
+        }
+        const ranked = [...scores].filter(([_, s]) => s >= needed).sort(([r, a], [q, b]) => b - a || r - q);
+        return [...new Set(ranked.map(([r, _]) => rankedKeys[r][1]))].slice(0, limit);
+    }
+
+    function search(query, limit = 20) {
+        query = query.toLowerCase();
+        let results;
+        if (query.endsWith(":") && query.split(":").length === 2) {
+            results = namespaces[query.slice(0, -1)] || [];
+        } else {
+            results = searchPrefix(query, limit);
+            if (results.length < limit) results = [...new Set(results.concat(searchSubstring(query, limit + results.length)))];
+            if (results.length === 0) results = searchFuzzy(query, limit);
+        }
+        return results.slice(0, limit).map(n => searchNodes[n]);
+    }
+
+    function showResults(sections) {
+        const div = document.getElementById("search-results");
+        div.innerHTML = "";
+        sections.forEach(([title, results]) => {
+            if (title) {
+                const header = document.createElement("b");
+                header.textContent = title;
+                div.appendChild(header);
+            }
+            results.forEach(node => {
+                const row = document.createElement("div");
+                row.textContent = node in plotted ? node + " (" + plotted[node] + ")" : node;
+                row.style.cursor = "pointer";
+                row.onclick = () => focusNode(node);
+                div.appendChild(row);
+            });
+        });
+    }
+
+    function focusNode(node) {
+        // Nodes within a cycle are shown through their cycle node
+        const target = plotted[node] || node;
+        selectNode([target]);
+        network.focus(target, {scale: 1, animation: true});
+        const n = searchNodes.indexOf(node);
+        showResults([
+            ["Produced by", searchIndex.producers[n] || []],
+            ["Consumed by", searchIndex.consumers[n] || []],
+        ].filter(([_, results]) => results.length).map(([title, results]) => [title, results.map(r => searchNodes[r])]));
+    }
+
+    function resetSelection() {
+        network.unselectAll();
+        neighbourhoodHighlight({nodes: []});
+        document.getElementById("search-input").value = "";
+        showResults([]);
+    }
+
+    document.getElementById("search-input").addEventListener("input", e => {
+        showResults([[null, e.target.value ? search(e.target.value) : []]]);
+    });
+</script>
+"""
 
 def cleanupGraph(G):
     G = G.copy()
@@ -0,0 +1,329 @@
+import bisect
+import heapq
+import json
+import math
+
+import networkx as nx
+
+
+class SearchIndex:
+
+    def __init__(self, items : list[str], recipes : dict[str, list[str]], producers : dict[str, list], consumers : dict[str, list], fingerprint=None,
+                 lookups=None):
+        """
+        Lookup tables over the item, recipe and ingredient member ids of a recipe graph.
+        The nodes are listed once, in a table made of the items and then the recipes of each type, named "{type}-{id}".
+        Keys are searchable strings, each one pointing to a node of the table :
+            - an item id points to its item node
+            - a recipe id points to its recipe node, as does the full "{type}-{id}" node name
+        Prefix lookups use a sorted key list, substring and fuzzy lookups use a trigram index.
+        Lookups ignore case, and when two keys are equal, the item comes before the recipes sharing its id.
+
+        Use SearchIndex.fromGraph to build it, SearchIndex.load to reload a saved one.
+
+        :param items: the item ids
+        :param recipes: the recipe ids of each recipe type
+        :param producers: the recipes producing each item, empty entries left out
+        :param consumers: the recipes consuming each item through their ingredients, empty entries left out
+        :param fingerprint: identifies the files the graph was built from, to tell when a saved index is outdated
+        :param lookups: the key orders and postings written by save, they are rebuilt when not given
+        """
+        self.items = items
+        self.recipes = recipes
+        self.producers = producers
+        self.consumers = consumers
+        self.fingerprint = fingerprint
+
+        self.nodes = items + [f"{t}-{r}" for t, ids in recipes.items() for r in ids]
+        recipeKeys = [r for ids in recipes.values() for r in ids]
+
+        # Items first, as for equal keys
+        self.namespaces = {}
+        for n, key in zip(self.nodes, items + recipeKeys):
+            self.namespaces.setdefault(key.split(":")[0], []).append(n)
+
+        keys = [(n, n) for n in self.nodes] + list(zip(recipeKeys, self.nodes[len(items):]))
+        if lookups is None:
+            lookups = self._getLookups(keys)
+
+        self._sortedIds = lookups["sorted"]
+        self.keys = [keys[k] for k in self._sortedIds]
+        self._sortedKeys = [k.lower() for k, _ in self.keys]
+
+        self._rankedIds = lookups["ranked"]
+        self._rankedKeys = [keys[k] for k in self._rankedIds]
+        self._rankedLower = [k.lower() for k, _ in self._rankedKeys]
+        # Saved postings are kept as text until a lookup needs them, see _getPosting
+        self._trigrams = lookups["trigrams"]
+        self._shortPostings = lookups["shortPostings"]
+
+        # Trigrams of the keys, filled as the fuzzy lookups need them
+        self._rankedTrigrams = {}
+
+    @staticmethod
+    def _getLookups(keys : list[tuple[str, str]]) -> dict:
+        """
+        :param keys: the (key, node) pairs
+        :return: The key orders and postings, which make up most of the building time
+        """
+        sortedIds = sorted(range(len(keys)), key=lambda k: (keys[k][0].lower(), keys[k][0] != keys[k][1], keys[k][1]))
+
+        # The trigram postings point into the keys ranked by closeness (shorter first),
+        # so substring lookups can stop as soon as they have enough results
+        rankedIds = sorted(range(len(keys)), key=lambda k: (len(keys[k][0]), keys[k][0].lower(), keys[k][0] != keys[k][1], keys[k][1]))
+        trigrams = {}
+        for r, k in enumerate(rankedIds):
+            for g in SearchIndex._getTrigrams(keys[k][0]):
+                trigrams.setdefault(g, []).append(r)
+
+        # Queries shorter than a trigram have their own postings, over the substrings of one or two characters
+        shortPostings = {}
+        for r, k in enumerate(rankedIds):
+            key = keys[k][0].lower()
+            for part in {key[i:i + n] for n in (1, 2) for i in range(len(key) - n + 1)}:
+                shortPostings.setdefault(part, []).append(r)
+
+        return {"sorted": sortedIds, "ranked": rankedIds, "trigrams": trigrams, "shortPostings": shortPostings}
+
+    @classmethod
+    def fromGraph(cls, graph : nx.DiGraph, fingerprint=None) -> "SearchIndex":
+        """
+        Builds the index from an uncollapsed recipe graph, usually GraphCreator.originalGraph.
+
+        :param graph: the recipe graph
+        :param fingerprint: identifies the files the graph was built from
+        :return: the index
+        """
+        items = []
+        recipes = {}
+        producers = {}
+        consumers = {}
+
+        for n, data in graph.nodes(data=True):
+            if data["type"] == "item":
+                items.append(n)
+                recipePred = [p for p in graph.predecessors(n) if graph.nodes[p]["type"] == "recipe"]
+                if recipePred:
+                    producers[n] = sorted(recipePred)
+            elif data["type"] == "recipe":
+                recipes.setdefault(data["recipeType"], []).append(n[len(data["recipeType"]) + 1:])
+            elif data["type"] == "ingredient" and graph.out_degree(n) > 0:
+                # Every member of an ingredient is consumed by the recipes using it
+                for member in graph.predecessors(n):
+                    consumers.setdefault(member, set()).update(graph.successors(n))
+
+        recipes = {t: sorted(recipes[t]) for t in sorted(recipes)}
+        consumers = {k: sorted(v) for k, v in consumers.items()}
+        return cls(sorted(items), recipes, producers, consumers, fingerprint)
+
+    @staticmethod
+    def _getTrigrams(key : str) -> set[str]:
+        key = key.lower()
+        if len(key) < 3:
+            return {key}
+        return {key[i:i + 3] for i in range(len(key) - 2)}
+
+    @staticmethod
+    def _encodePosting(posting) -> str:
+        return posting if isinstance(posting, str) else " ".join(map(str, posting))
+
+    @staticmethod
+    def _getPosting(postings : dict, part : str) -> list[int]:
+        """
+        :param postings: the trigram or short postings
+        :param part: the looked up trigram or substring
+        :return: The posting list, decoded and kept if it was still the text of a saved index
+        """
+        posting = postings.get(part, [])
+        if isinstance(posting, str):
+            posting = postings[part] = [int(r) for r in posting.split()]
+        return posting
+
+    @staticmethod
+    def getNodes(data : dict) -> list[str]:
+        """
+        :param data: the content of an index, as given by toDict
+        :return: The node table the producers / consumers positions refer to
+        """
+        return data["items"] + [f"{t}-{r}" for t, ids in data["recipes"].items() for r in ids]
+
+    @staticmethod
+    def _unique(nodes) -> list[str]:
+        return list(dict.fromkeys(nodes))
+
+    # --------------------------------------------------------------------
+    #                            Public Methods
+    # --------------------------------------------------------------------
+
+    def searchPrefix(self, prefix : str, limit=None) -> list[str]:
+        """
+        :param prefix: the beginning of an id, e.g. "minecraft:iron"
+        :param limit: maximum number of results
+        :return: The nodes having a key starting with the prefix, in alphabetical order
+        """
+        prefix = prefix.lower()
+        results = {}
+        for i in range(bisect.bisect_left(self._sortedKeys, prefix), len(self.keys)):
+            if not self._sortedKeys[i].startswith(prefix):
+                break
+            results[self.keys[i][1]] = None
+            if limit is not None and len(results) >= limit:
+                break
+        return list(results)
+
+    def searchNamespace(self, mod : str) -> list[str]:
+        """
+        :param mod: a mod namespace, e.g. "create"
+        :return: The items and then the recipes of this mod, in alphabetical order
+        """
+        return list(self.namespaces.get(mod.lower().rstrip(":"), []))
+
+    def searchSubstring(self, query : str, limit=None) -> list[str]:
+        """
+        :param query: any part of an id, e.g. "iron_ingot"
+        :param limit: maximum number of results
+        :return: The nodes having a key containing the query, closest first
+        """
+        query = query.lower()
+        if len(query) < 3:
+            candidates = self._getPosting(self._shortPostings, query)
+        else:
+            # The rarest trigram of the query is enough to find its candidates
+            postings = [self._getPosting(self._trigrams, g) for g in self._getTrigrams(query)]
+            candidates = min(postings, key=len)
+
+        results = {}
+        for r in candidates:
+            if query in self._rankedLower[r]:
+                results[self._rankedKeys[r][1]] = None
+                if limit is not None and len(results) >= limit:
+                    break
+        return list(results)
+
+    def searchFuzzy(self, query : str, limit=10, threshold=0.5) -> list[str]:
+        """
+        Ranks the keys by the share of the query trigrams they contain, which tolerates typos.
+        Spaces are read as underscores, so "iron ingot" matches "minecraft:iron_ingot".
+
+        :param query: an approximate id, e.g. "iron ingto"
+        :param limit: maximum number of results
+        :param threshold: minimal share of matching trigrams, between 0 and 1
+        :return: The closest nodes, best match first
+        """
+        grams = self._getTrigrams(query.replace(" ", "_"))
+        needed = max(1, math.ceil(threshold * len(grams)))
+
+        # Trigrams are read rarest first. A key holding none of the trigrams read so far shares at most
+        # the remaining ones, so the reading stops once that cannot beat the current results.
+        scores = {}
+        best = {}
+        for i, g in enumerate(sorted(grams, key=lambda g: len(self._getPosting(self._trigrams, g)))):
+            remaining = len(grams) - i
+            if remaining < needed or (len(best) >= limit and remaining < heapq.nlargest(limit, best.values())[-1]):
+                break
+            for r in self._getPosting(self._trigrams, g):
+                if r not in scores:
+                    if r not in self._rankedTrigrams:
+                        self._rankedTrigrams[r] = self._getTrigrams(self._rankedLower[r])
+                    scores[r] = len(grams & self._rankedTrigrams[r])
+                    node = self._rankedKeys[r][1]
+                    best[node] = max(best.get(node, 0), scores[r])
+
+        # Shorter keys win ties, as they are closer to the query
+        ranked = sorted((-score, r) for r, score in scores.items() if score >= needed)
+        return self._unique(self._rankedKeys[r][1] for _, r in ranked)[:limit]
+
+    def search(self, query : str, limit=10) -> list[str]:
+        """
+        Combined lookup, as used by the search bar of the exported graphs :
+            - "mod:" lists the namespace
+            - otherwise, prefix matches come first, then substring matches
+            - fuzzy matches are only looked for when nothing else matched
+
+        :param query: the searched text
+        :param limit: maximum number of results
+        :return: The matching nodes
+        """
+        if query.endswith(":") and query.count(":") == 1:
+            return self.searchNamespace(query)[:limit]
+
+        results = self.searchPrefix(query, limit)
+        if len(results) < limit:
+            # Prefix matches are substring matches too, so they may come back
+            results = self._unique(results + self.searchSubstring(query, limit + len(results)))
+        if len(results) == 0:
+            results = self.searchFuzzy(query, limit)
+        return results[:limit]
+
+    def getProducers(self, item : str) -> list[str]:
+        """
+        :param item: an item id
+        :return: The recipes producing this item
+        """
+        return list(self.producers.get(item, []))
+
+    def getConsumers(self, item : str) -> list[str]:
+        """
+        :param item: an item id
+        :return: The recipes consuming this item
+        """
+        return list(self.consumers.get(item, []))
+
+    def toDict(self, nodes=None) -> dict:
+        """
+        The recipes are stored by type, without their type prefix, and the producers / consumers refer to
+        the nodes by their position in the node table (items, then recipes), so that no id is written twice.
+
+        :param nodes: if given, only keeps the entries about these nodes
+        :return: The serializable content of the index, from which it can be rebuilt
+        """
+        full = nodes is None
+        nodes = set(self.nodes if full else nodes)
+
+        items = [n for n in self.items if n in nodes]
+        recipes = {}
+        for t, ids in self.recipes.items():
+            kept = [r for r in ids if f"{t}-{r}" in nodes]
+            if kept:
+                recipes[t] = kept
+        table = {n: i for i, n in enumerate(self.getNodes({"items": items, "recipes": recipes}))}
+
+        def positions(lookup):
+            result = {}
+            for n, rs in lookup.items():
+                kept = [table[r] for r in rs if r in table]
+                if n in table and kept:
+                    result[table[n]] = kept
+            return result
+
+        data = {"items": items, "recipes": recipes, "producers": positions(self.producers), "consumers": positions(self.consumers)}
+        if full:
+            data["fingerprint"] = self.fingerprint
+        return data
+
+    def save(self, path : str):
+        """
+        :param path: path to the index json file
+        """
+        # The postings are written as text, which is much faster to load than lists of numbers
+        lookups = {"sorted": self._sortedIds, "ranked": self._rankedIds,
+                   "trigrams": {g: self._encodePosting(p) for g, p in self._trigrams.items()},
+                   "shortPostings": {g: self._encodePosting(p) for g, p in self._shortPostings.items()}}
+        with open(path, "w") as f:
+            json.dump({**self.toDict(), "lookups": lookups}, f)
+
+    @classmethod
+    def load(cls, path : str) -> "SearchIndex":
+        """
+        :param path: path to an index json file written by SearchIndex.save
+        :return: the index
+        """
+        with open(path) as f:
+            data = json.load(f)
+        nodes = cls.getNodes(data)
+
+        def names(lookup):
+            return {nodes[int(n)]: [nodes[r] for r in rs] for n, rs in lookup.items()}
+
+        return cls(data["items"], data["recipes"], names(data["producers"]), names(data["consumers"]), data.get("fingerprint"),
+                   data.get("lookups"))